@@ -1,17 +1,14 @@
 # streamlit_app.py
 import os
-import io
-import socket
 import time
 import pandas as pd
 import streamlit as st
-import requests
 
 from dotenv import load_dotenv
-from components.data_form import DataForm
-from lib.helpers import build_where_from_params, distance_km_sql
-from lib.databricks_sql import run_sql
-from components.visualizations import avg_magnitude_per_net,avg_magnitude_per_net_pie,avg_magnitude_per_net_scatter
+from components.data_form import EarthquakeDataForm
+from lib.helpers import build_where_from_params
+from lib.databricks_sql import RESULT_TTL, run_sql, submit_sql
+from components.visualizations import render_net_dashboard
 
 load_dotenv()
 DATABRICKS_SERVER_HOSTNAME = os.getenv("DATABRICKS_SERVER_HOSTNAME")
@@ -20,44 +17,34 @@ DATABRICKS_PERSONAL_ACCESS_TOKEN = os.getenv("DATABRICKS_PERSONAL_ACCESS_TOKEN")
 DATABRICKS_HOST_URL = os.getenv("DATABRICKS_HOST_URL") or (f"https://{DATABRICKS_SERVER_HOSTNAME}" if DATABRICKS_SERVER_HOSTNAME else None)
 DATABRICKS_WAREHOUSE_ID = os.getenv("DATABRICKS_WAREHOUSE_ID")
 TABLE_NAME = "workspace.default.earthquakes"
-limit = 100
-df = None
+# Columns read by the form, charts and results table
+COLUMNS = ["time", "mag", "depth", "net", "latitude", "longitude", "place", "id"]
+# Rows sent to the browser per results-table page
+PAGE_SIZE = 500
+time_bounds = (None, None)
 source_label = None
 
-# ---- App Config ----
-st.set_page_config(page_title="Earthquake Data Explorer", layout="wide")
-st.title("Earthquake Data Explorer")
-st.caption("Explore and analyze earthquake data from the Databricks earthquake_data table.")
+@st.cache_resource(ttl=300, show_spinner=False)
+def fetch_net_mag_agg(where_clause: str, sql_params: tuple = ()):
+    """Future of the average magnitude per net, aggregated on the warehouse.
 
-# Auto-load data on app start
-try:
-    df = run_sql(f"SELECT * FROM {TABLE_NAME} LIMIT {int(limit)}")
-except Exception as e:
-    st.error(f"Failed to query earthquake data. {e}")
-    st.stop()
+    Started on the library's background pool so it overlaps the row query; the Future itself
+    is cached, so reruns with the same filter reuse the running or finished statement.
+    """
+    return submit_sql(f"SELECT net, AVG(mag) AS mag FROM {TABLE_NAME}{where_clause} GROUP BY net ORDER BY mag DESC", sql_params)
 
-# ---- Init session state ----
-if 'show_results' not in st.session_state:
-    st.session_state.show_results = False
-if 'query_params' not in st.session_state:
-    st.session_state.query_params = {}
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_time_bounds():
+    """Earliest and latest event dates in the table, used as the form's default date range."""
+    bounds = run_sql(f"SELECT min(time) AS tmin, max(time) AS tmax FROM {TABLE_NAME}")
+    tmin, tmax = pd.to_datetime(bounds.iloc[0][["tmin", "tmax"]], utc=True, errors="coerce")
+    if pd.isna(tmin) or pd.isna(tmax):
+        return None, None
+    return tmin.date(), tmax.date()
 
-# ---- Init navigation ----
-if st.session_state.show_results:
-    if st.button("← Back to Query Form"):
-        st.session_state.show_results = False
-        st.rerun()
-    st.header("Query Results")
-else:
-    st.header("Build Your Earthquake Data Query")
-
-if not st.session_state.show_results:
-    # ---- Render form ----
-    DataForm(df)
-else:
-    # ---- Render Results ----
-    params = st.session_state.query_params
-    
+@st.fragment
+def _results_view(params: dict):
+    """Results page body; widget changes here rerun only this fragment."""
     # Query options on results page
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -68,32 +55,93 @@ else:
         max_rows = st.number_input("Max rows", 10, 10000, 1000)
     
     # Build query
-    where_clause = build_where_from_params(params)
-    q = f"SELECT * FROM {TABLE_NAME}{where_clause} ORDER BY {sort_by} {sort_order} NULLS LAST LIMIT {max_rows}"
+    where_clause, sql_params = build_where_from_params(params, st.session_state.get("time_bounds", (None, None))[0])
+    # ORDER BY + LIMIT runs as a top-K on the warehouse; id breaks ties so the cut is deterministic
+    q = f"SELECT {', '.join(COLUMNS)} FROM {TABLE_NAME}{where_clause} ORDER BY {sort_by} {sort_order} NULLS LAST, id LIMIT {max_rows}"
     
     # Execute query and show results
     try:
-        filtered_df = run_sql(q)
+        # The per-net aggregate is independent of the row query; start it first so both round trips overlap
+        agg_future = fetch_net_mag_agg(where_clause, sql_params)
+        
+        # If the last fetch for this filter returned every matching row and is still within the
+        # result TTL, re-sort it locally
+        filter_key = (where_clause, sql_params)
+        held = st.session_state.get("filtered_result")
+        if (held and held["key"] == filter_key and held["complete"]
+                and time.monotonic() - held["fetched_at"] < RESULT_TTL):
+            filtered_df = held["df"].sort_values([sort_by, "id"], ascending=[sort_order == "ASC", True], na_position="last").head(max_rows)
+        else:
+            filtered_df = run_sql(q, sql_params)
+            filtered_df["net"] = filtered_df["net"].astype("category")
+            # float32 is ample for the source precision
+            for col in ("mag", "depth", "latitude", "longitude"):
+                filtered_df[col] = pd.to_numeric(filtered_df[col], errors="coerce", downcast="float")
+            st.session_state.filtered_result = {
+                "key": filter_key, "df": filtered_df, "complete": len(filtered_df) < max_rows,
+                "fetched_at": time.monotonic(),
+            }
         
         # Show query details
         with st.expander("Query Details"):
             st.code(q)
+            if sql_params:
+                st.json({name: value for name, value, _ in sql_params})
         
         # # Visualizations
         st.subheader("Visualizations")
-        viz_col1, viz_col2, viz_col3 = st.columns(3)
-        
-        with viz_col1:
-            avg_magnitude_per_net(filtered_df)
-        with viz_col2:
-            avg_magnitude_per_net_pie(filtered_df)
-        with viz_col3:
-            avg_magnitude_per_net_scatter(filtered_df)
+        try:
+            agg_df = agg_future.result().copy(deep=False)
+        except Exception:
+            # Don't keep serving a failed statement from the cache
+            fetch_net_mag_agg.clear()
+            raise
+        agg_df["mag"] = pd.to_numeric(agg_df["mag"], errors="coerce")
+        render_net_dashboard(agg_df)
         
         # Data table
-        st.dataframe(filtered_df, use_container_width=True, height=600)
+        # Only the current page is serialized to the browser; paging reruns just this fragment
+        n_pages = max(1, -(-len(filtered_df) // PAGE_SIZE))
+        page = st.number_input(f"Page (of {n_pages})", 1, n_pages, 1) if n_pages > 1 else 1
+        st.dataframe(filtered_df.iloc[(page - 1) * PAGE_SIZE : page * PAGE_SIZE], use_container_width=True, height=600)
         
     except Exception as e:
         st.error(f"Query failed: {e}")
         st.code(f"Attempted query: {q}")
 
+# ---- App Config ----
+st.set_page_config(page_title="Earthquake Data Explorer", layout="wide")
+st.title("Earthquake Data Explorer")
+st.caption("Explore and analyze earthquake data from the Databricks earthquake_data table.")
+
+# ---- Init session state ----
+if 'show_results' not in st.session_state:
+    st.session_state.show_results = False
+if 'query_params' not in st.session_state:
+    st.session_state.query_params = {}
+
+# Auto-load the table's date range for the form defaults once per session; not needed on the results page
+if not st.session_state.show_results:
+    try:
+        if 'time_bounds' not in st.session_state:
+            st.session_state.time_bounds = load_time_bounds()
+        time_bounds = st.session_state.time_bounds
+    except Exception as e:
+        st.error(f"Failed to query earthquake data. {e}")
+        st.stop()
+
+# ---- Init navigation ----
+if st.session_state.show_results:
+    if st.button("← Back to Query Form"):
+        st.session_state.show_results = False
+        st.rerun()
+    st.header("Query Results")
+else:
+    st.header("Build Your Earthquake Data Query")
+
+if not st.session_state.show_results:
+    # ---- Render form ----
+    EarthquakeDataForm(time_bounds)
+else:
+    # ---- Render Results ----
+    _results_view(st.session_state.query_params)
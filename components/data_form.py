@@ -1,21 +1,59 @@
+import math
 import streamlit as st
 import pandas as pd
+from types import MappingProxyType
 
-def EarthquakeDataForm(df):
+# Pre-defined location list
+PRESET_LOCATIONS = MappingProxyType({
+    "(none)": None,
+    "Dallas, TX": (32.8, -96.8),
+    "Arlington, TX": (32.7357, -97.1081),
+    "Houston, TX": (29.7604, -95.3698),
+    "San Antonio, TX": (29.4241, -98.4936),
+    "Los Angeles, CA": (34.0522, -118.2437),
+    "San Diego, CA": (32.7157, -117.1611),
+    "San Francisco, CA": (37.7749, -122.4194),
+    "New York, NY": (40.7128, -74.0060),
+    "Chicago, IL": (41.8781, -87.6298),
+    "Philadelphia, PA": (39.9526, -75.1652),
+    "Phoenix, AZ": (33.4484, -112.0740),
+    "Anchorage, AK": (61.0, -150.0),
+})
+PRESET_KEYS = tuple(PRESET_LOCATIONS)
+MAG_OPTS = tuple(range(11))
+
+def _submit_earthquake_query():
+    """Copy the submitted earthquake form values into the results page query params."""
+    selected_location = st.session_state.eq_location
+    latitude = longitude = None
+    if selected_location != "(none)":
+        latitude, longitude = PRESET_LOCATIONS[selected_location]
+    st.session_state.query_params = {
+        'time_min': st.session_state.eq_time_min, 'time_max': st.session_state.eq_time_max,
+        'mag_min': st.session_state.eq_mag_min, 'mag_max': st.session_state.eq_mag_max,
+        'latitude': latitude, 'longitude': longitude, 'radius_km': st.session_state.eq_radius_km,
+        'selected_location': selected_location
+    }
+    st.session_state.show_results = True
+
+def _submit_food_query():
+    """Copy the submitted food form values into the results page query params."""
+    coordinates = []
+    for i in range(10):
+        x = st.session_state.get(f"x_{i}", 0)
+        y = st.session_state.get(f"y_{i}", 0)
+        color = st.session_state.get(f"color_{i}", "#1f77b4")
+        coordinates.append({"x": x, "y": y, "color": color})
+    st.session_state.query_params = {
+        'amt_range': st.session_state.amt_range,
+        'coordinates': coordinates
+    }
+    st.session_state.show_results = True
+
+def EarthquakeDataForm(time_bounds):
     with st.form("earthquake_query_form"):
-        # Try to get default dates from data, otherwise use reasonable defaults
-        default_start = None
-        default_end = None
-        
-        if "time" in df.columns:
-            try:
-                tser = pd.to_datetime(df["time"], errors="coerce")
-                tmin, tmax = tser.min(), tser.max()
-                if not pd.isna(tmin) and not pd.isna(tmax):
-                    default_start = tmin.date()
-                    default_end = tmax.date()
-            except:
-                pass
+        # Default dates come from the table's (min, max) time, otherwise use reasonable defaults
+        default_start, default_end = time_bounds
         
         # If we couldn't get dates from data, use reasonable defaults
         if default_start is None:
@@ -23,97 +61,56 @@ def EarthquakeDataForm(df):
         if default_end is None:
             default_end = pd.to_datetime("2025-12-31").date()
         
-        # Form fields in a clean layout
-        col1, col2 = st.columns(2)
-        with col1:
-            time_min = st.date_input("Start date", value=default_start)
-        with col2:
-            time_max = st.date_input("End date", value=default_end)
-        
+        # Form fields in a clean layout: one two-column block, left/right pairs stacked
         col1, col2 = st.columns(2)
         with col1:
-            mag_min = st.selectbox("Minimum magnitude", options=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10], index=0)
+            st.date_input("Start date", value=default_start, key="eq_time_min")
+            st.selectbox("Minimum magnitude", options=MAG_OPTS, index=0, key="eq_mag_min")
+            st.selectbox("Location", options=PRESET_KEYS, index=0, key="eq_location")
         with col2:
-            mag_max = st.selectbox("Maximum magnitude", options=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10], index=10)
+            st.date_input("End date", value=default_end, key="eq_time_max")
+            st.selectbox("Maximum magnitude", options=MAG_OPTS, index=10, key="eq_mag_max")
+            st.number_input("Within (km)", min_value=1, max_value=10000, value=100, step=10, key="eq_radius_km")
         
-        # Pre-defined location list
-        preset_locations = {
-            "(none)": None,
-            "Dallas, TX": (32.8, -96.8),
-            "Arlington, TX": (32.7357, -97.1081),
-            "Houston, TX": (29.7604, -95.3698),
-            "San Antonio, TX": (29.4241, -98.4936),
-            "Los Angeles, CA": (34.0522, -118.2437),
-            "San Diego, CA": (32.7157, -117.1611),
-            "San Francisco, CA": (37.7749, -122.4194),
-            "New York, NY": (40.7128, -74.0060),
-            "Chicago, IL": (41.8781, -87.6298),
-            "Philadelphia, PA": (39.9526, -75.1652),
-            "Phoenix, AZ": (33.4484, -112.0740),
-            "Anchorage, AK": (61.0, -150.0),
-        }
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            selected_location = st.selectbox("Location", options=list(preset_locations.keys()), index=0)
-        with col2:
-            radius_km = st.number_input("Within (km)", min_value=1, max_value=10000, value=100, step=10)
-        
-        # Get coordinates for selected location
-        latitude = longitude = None
-        if selected_location != "(none)":
-            latitude, longitude = preset_locations[selected_location]
-        
-        # Submit
-        if st.form_submit_button("Run Query", type="primary"):
-            st.session_state.query_params = {
-                'time_min': time_min, 'time_max': time_max,
-                'mag_min': mag_min, 'mag_max': mag_max,
-                'latitude': latitude, 'longitude': longitude, 'radius_km': radius_km,
-                'selected_location': selected_location
-            }
-            st.session_state.show_results = True
-            st.rerun()
-
+        # Submit; the callback runs before the form's own rerun, so no extra st.rerun() is needed
+        st.form_submit_button("Run Query", type="primary", on_click=_submit_earthquake_query)
 
 
-def FoodDataForm(df):
+def FoodDataForm(amount_range):
+    # Slider bounds come from the table's Amount range, falling back to 0-50
+    lo, hi = pd.to_numeric(amount_range[["lo", "hi"]], errors="coerce")
+    min_value = int(math.floor(lo)) if not pd.isna(lo) else 0
+    max_value = int(math.ceil(hi)) if not pd.isna(hi) else 50
+    if max_value <= min_value:
+        max_value = min_value + 1
+    # Default to 10-25 where the table covers it, otherwise the whole range
+    default_range = (max(min_value, 10), min(max_value, 25))
+    if default_range[0] >= default_range[1]:
+        default_range = (min_value, max_value)
+    
     with st.form("food_query_form"):
         col1,= st.columns(1)
         with col1:
-            amt_range = st.slider(
+            st.slider(
                 "Select a price range",
-                min_value=0,
-                max_value=50,
-                value=(10,25)
+                min_value=min_value,
+                max_value=max_value,
+                value=default_range,
+                key="amt_range"
             )
         
         # Simplified coordinate input section
         st.write("**Enter coordinate pairs (X, Y, Color) - up to 10 points**")
-        coordinates = []
         
         for i in range(10):
             with st.expander(f"Point {i+1}", expanded=(i==0)):
                 col_x, col_y, col_c = st.columns(3)
                 with col_x:
-                    x = st.number_input(f"X", key=f"x_{i}")
+                    st.number_input(f"X", key=f"x_{i}")
                 with col_y:
-                    y = st.number_input(f"Y", key=f"y_{i}")
+                    st.number_input(f"Y", key=f"y_{i}")
                 with col_c:
-                    color = st.color_picker(f"Color", value="#1f77b4", key=f"color_{i}")
+                    st.color_picker(f"Color", value="#1f77b4", key=f"color_{i}")
         
         # Submit
-        if st.form_submit_button("Run Food Query", type="primary"):
-            coordinates = []
-            for i in range(10):
-                x = st.session_state.get(f"x_{i}", 0)
-                y = st.session_state.get(f"y_{i}", 0)
-                color = st.session_state.get(f"color_{i}", "#1f77b4")
-                coordinates.append({"x": x, "y": y, "color": color})
-            
-            st.session_state.query_params = {
-                'amt_range': amt_range,
-                'coordinates': coordinates
-            }
-            st.session_state.show_results = True
-            st.rerun()
+        st.form_submit_button("Run Food Query", type="primary", on_click=_submit_food_query)
@@ -1,52 +1,29 @@
+import altair as alt
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 
-def avg_magnitude_per_net(df: pd.DataFrame, title: str = "Average Magnitude per Net"):
-    """Render a bar chart showing average magnitude per net category."""
-    if "net" not in df.columns or "mag" not in df.columns or len(df) == 0:
+def render_net_dashboard(agg_df: pd.DataFrame, title: str = "Average Magnitude per Net"):
+    """Render bar, pie and scatter views of average magnitude per net as a single chart."""
+    if "net" not in agg_df.columns or "mag" not in agg_df.columns or len(agg_df) == 0:
         st.warning("Required columns 'net' or 'mag' not found or no data available.")
         return
-    # Ensure mag is numeric
-    df = df.copy()
-    df["mag"] = pd.to_numeric(df["mag"], errors="coerce")
-    agg_df = df.groupby("net")["mag"].mean().sort_values(ascending=False)
     st.subheader(title)
-    st.bar_chart(agg_df, use_container_width=True)
-
-def avg_magnitude_per_net_pie(df: pd.DataFrame, title: str = "Average Magnitude per Net (Pie Chart)"):
-    """Render a pie chart showing average magnitude per net category using matplotlib."""
-    if "net" not in df.columns or "mag" not in df.columns or len(df) == 0:
-        st.warning("Required columns 'net' or 'mag' not found or no data available.")
-        return
-    df = df.copy()
-    df["mag"] = pd.to_numeric(df["mag"], errors="coerce")
-    agg_df = df.groupby("net")["mag"].mean()
-    st.subheader(title)
-    fig, ax = plt.subplots()
-    ax.pie(agg_df, labels=agg_df.index, autopct='%1.1f%%', startangle=90)
-    ax.axis('equal')
-    st.pyplot(fig)
-
-def avg_magnitude_per_net_scatter(df: pd.DataFrame, title: str = "Average Magnitude per Net (Scatter Plot)"):
-    """Render a scatter plot showing average magnitude per net category."""
-    if "net" not in df.columns or "mag" not in df.columns or len(df) == 0:
-        st.warning("Required columns 'net' or 'mag' not found or no data available.")
-        return
-    df = df.copy()
-    df["mag"] = pd.to_numeric(df["mag"], errors="coerce")
-    agg_df = df.groupby("net")["mag"].mean().reset_index()
-    st.subheader(title)
-    st.scatter_chart(agg_df, x="net", y="mag", use_container_width=True)
+    base = alt.Chart(agg_df)
+    bar = base.mark_bar().encode(x=alt.X("net:N", sort="-y"), y="mag:Q").properties(title="Bar Chart")
+    pie = base.mark_arc().encode(
+        theta=alt.Theta("mag:Q", stack=True),
+        color=alt.Color("net:N"),
+        tooltip=["net", alt.Tooltip("mag:Q", format=".2f")],
+    ).properties(title="Pie Chart")
+    scatter = base.mark_circle(size=80).encode(x="net:N", y="mag:Q").properties(title="Scatter Plot")
+    st.altair_chart(alt.hconcat(bar, pie, scatter), use_container_width=True)
 
 def food_amount_bar_chart(df: pd.DataFrame, title: str = "Amount by Food"):
     """Render a bar chart showing amount per food item."""
     if "Food" not in df.columns or "Amount" not in df.columns or len(df) == 0:
         st.warning("Required columns 'Food' or 'Amount' not found or no data available.")
         return
-    df = df.copy()
-    df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce")
-    agg_df = df.groupby("Food")["Amount"].sum().sort_values(ascending=False)
+    agg_df = pd.to_numeric(df["Amount"], errors="coerce").groupby(df["Food"]).sum().sort_values(ascending=False)
     st.subheader(title)
     st.bar_chart(agg_df, use_container_width=True)
 
@@ -55,10 +32,9 @@ def food_amount_pie_chart(df: pd.DataFrame, title: str = "Amount by Food (Pie Ch
     if "Food" not in df.columns or "Amount" not in df.columns or len(df) == 0:
         st.warning("Required columns 'Food' or 'Amount' not found or no data available.")
         return
-    df = df.copy()
-    df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce")
-    agg_df = df.groupby("Food")["Amount"].sum()
+    agg_df = pd.to_numeric(df["Amount"], errors="coerce").groupby(df["Food"]).sum()
     st.subheader(title)
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
     ax.pie(agg_df, labels=agg_df.index, autopct='%1.1f%%', startangle=90)
     ax.axis('equal')
@@ -71,6 +47,7 @@ def coordinate_scatter_plot(coordinates: list, title: str = "Coordinate Scatter
         return
     
     st.subheader(title)
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
     
     for coord in coordinates:
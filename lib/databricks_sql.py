@@ -1,125 +1,126 @@
+import functools
+import hashlib
+import logging
 import os
-import socket
+import pathlib
+import re
+import tempfile
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
 import requests
 import streamlit as st
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional faster JSON decoder
+    orjson = None
 
 load_dotenv()
 
-@st.cache_data(show_spinner=False)
-def run_sql(query: str):
-    """Execute SQL via Databricks SQL Statements REST API and return a DataFrame."""
-    # Read Databricks config from environment (same names used in assignmentTwo.py)
-    DATABRICKS_SERVER_HOSTNAME = os.getenv("DATABRICKS_SERVER_HOSTNAME")
-    DATABRICKS_HOST_URL = os.getenv("DATABRICKS_HOST_URL") or (f"https://{DATABRICKS_SERVER_HOSTNAME}" if DATABRICKS_SERVER_HOSTNAME else None)
-    DATABRICKS_WAREHOUSE_ID = os.getenv("DATABRICKS_WAREHOUSE_ID")
-    DATABRICKS_PERSONAL_ACCESS_TOKEN = os.getenv("DATABRICKS_PERSONAL_ACCESS_TOKEN")
+logger = logging.getLogger(__name__)
+# Unknown level names fall back to WARNING rather than failing the import
+_LOG_LEVEL = logging.getLevelName(os.getenv("APP_LOG_LEVEL", "WARNING").upper())
+logger.setLevel(_LOG_LEVEL if isinstance(_LOG_LEVEL, int) else logging.WARNING)
 
-    # Quick network precheck to avoid long hangs on unreachable host
-    if DATABRICKS_SERVER_HOSTNAME:
-        try:
-            sock = socket.create_connection((DATABRICKS_SERVER_HOSTNAME, 443), timeout=5)
-            sock.close()
-        except Exception as e:
-            raise RuntimeError(f"Network error reaching {DATABRICKS_SERVER_HOSTNAME}: {e}")
+# On-disk result cache shared across processes and restarts; in-process caching is _run_sql_impl's job
+_CACHE_DIR = pathlib.Path(os.getenv("DBX_CACHE_DIR", ".dbx_cache"))
+_CACHE_TTL = int(os.getenv("DBX_CACHE_TTL", "600"))
+_CACHE_MAX_BYTES = int(os.getenv("DBX_CACHE_MAX_MB", "512")) * 1024 * 1024
 
-    if not (DATABRICKS_HOST_URL and DATABRICKS_WAREHOUSE_ID and DATABRICKS_PERSONAL_ACCESS_TOKEN):
-        raise RuntimeError(
-            "Missing Databricks REST API configuration. Ensure DATABRICKS_HOST_URL (or DATABRICKS_SERVER_HOSTNAME), "
-            "DATABRICKS_WAREHOUSE_ID, and DATABRICKS_PERSONAL_ACCESS_TOKEN are set."
-        )
+# Shared keep-alive session so submit and poll requests reuse one TLS connection
+SESSION = requests.Session()
+# Retry transient 429/5xx responses on idempotent requests (polls, chunk downloads); POST is not
+# retried. Connect failures are never retried so an unreachable host fails within the connect
+# timeout, and once retries run out the last response is returned for the status checks below.
+_RETRY = Retry(total=3, connect=0, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=_RETRY))
 
-    url = f"{DATABRICKS_HOST_URL.rstrip('/')}/api/2.0/sql/statements"
-    headers = {
-        "Authorization": f"Bearer {DATABRICKS_PERSONAL_ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "warehouse_id": DATABRICKS_WAREHOUSE_ID,
-        "statement": query,
-        "wait_timeout": "30s",
-    }
+def _json(resp: requests.Response):
+    """Decode a JSON response body, using orjson when it is installed."""
+    return orjson.loads(resp.content) if orjson else resp.json()
 
-    t0 = time.time()
-    resp = requests.post(url, headers=headers, json=payload, timeout=60)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Error submitting statement: {resp.status_code} - {resp.text}")
-    body = resp.json()
+def _download_arrow_chunk(link: dict) -> pa.Table:
+    """Download one presigned Arrow IPC chunk."""
+    # Presigned URLs must not carry the Databricks bearer token, but do need any headers the link lists
+    with SESSION.get(link["external_link"], headers=link.get("http_headers"), timeout=60, stream=True) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"Error downloading result chunk: {r.status_code} - {r.text}")
+        # Decode record batches as they arrive instead of buffering the whole chunk
+        r.raw.decode_content = True
+        return pa.ipc.open_stream(r.raw).read_all()
 
-    # If result is immediately available
-    if body.get("status", {}).get("state") in ("SUCCEEDED",) and body.get("result"):
-        result = body["result"]
+def _read_arrow_links(result: dict, host_url: str, headers: dict) -> pd.DataFrame:
+    """Download EXTERNAL_LINKS Arrow chunks of a statement result into one DataFrame."""
+    # Walk the chunk listing first (small JSON calls), then fetch the chunk bodies in parallel
+    all_links = []
+    links = result.get("external_links", [])
+    while links:
+        all_links.extend(links)
+        next_link = links[-1].get("next_chunk_internal_link")
+        if not next_link:
+            break
+        r = SESSION.get(f"{host_url.rstrip('/')}{next_link}", headers=headers, timeout=30)
+        if r.status_code != 200:
+            raise RuntimeError(f"Error fetching result chunk: {r.status_code} - {r.text}")
+        links = _json(r).get("external_links", [])
+
+    if len(all_links) == 1:
+        tables = [_download_arrow_chunk(all_links[0])]
     else:
-        # Poll for completion
-        stmt_id = body.get("statement_id") or body.get("statement", {}).get("statement_id") or body.get("id")
-        if not stmt_id:
-            # Some responses include result directly
-            if body.get("result"):
-                result = body["result"]
-            else:
-                raise RuntimeError("Did not receive a statement_id or result from Databricks API.")
-        else:
-            poll_url = f"{url}/{stmt_id}"
-            deadline = time.time() + 120  # up to 2 minutes
-            last_state = None
-            while time.time() < deadline:
-                r = requests.get(poll_url, headers=headers, timeout=30)
-                if r.status_code != 200:
-                    raise RuntimeError(f"Polling error: {r.status_code} - {r.text}")
-                data = r.json()
-                state = data.get("status", {}).get("state")
-                if state != last_state:
-                    last_state = state
-                if state in ("SUCCEEDED",):
-                    result = data.get("result")
-                    break
-                if state in ("FAILED", "CANCELED"):
-                    raise RuntimeError(f"Statement {state.lower()}: {data}")
-                time.sleep(1.0)
-            else:
-                raise RuntimeError("Timed out waiting for statement to complete.")
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            tables = list(ex.map(_download_arrow_chunk, all_links))
+    # The concatenated table is discarded afterwards, so let pandas take over its buffers
+    return pa.concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True)
 
+# Manifest type_name -> Arrow type for columns that JSON_ARRAY delivers as strings
+_ARROW_TYPES = {
+    "BYTE": pa.int8(), "SHORT": pa.int16(), "INT": pa.int32(), "LONG": pa.int64(),
+    "FLOAT": pa.float32(), "DOUBLE": pa.float64(), "DECIMAL": pa.float64(), "BOOLEAN": pa.bool_(),
+}
+_TEMPORAL_TYPES = {"TIMESTAMP", "TIMESTAMP_NTZ", "DATE"}
 
-    print(result)
-    
-    
-    if not result:
-        raise RuntimeError("No result returned from Databricks API.")
+def _rows_to_df(rows: list, cols: list, columns_meta: list) -> pd.DataFrame:
+    """Build a DataFrame column-wise from a JSON data_array, casting columns by manifest type."""
+    types = {meta.get("name"): meta.get("type_name") for meta in columns_meta}
+    cols_data = list(zip(*rows)) if rows else [() for _ in cols]
+    arrays, unparsed = [], []
+    for name, values in zip(cols, cols_data):
+        arr = pa.array(values, type=pa.string())
+        target = _ARROW_TYPES.get(types.get(name))
+        if target is not None:
+            try:
+                # Typed cast parses the strings in C instead of per-cell pandas inference
+                arr = arr.cast(target)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                unparsed.append(name)
+        arrays.append(arr)
+    out_df = pa.Table.from_arrays(arrays, names=list(cols)).to_pandas(self_destruct=True)
 
-    # Parse columns and rows
-    rows = result.get("data_array", [])
-    
-    # Manual column names matching schema (22 columns, no duplicates)
-    cols = [
-        "time", "latitude", "longitude", "depth", "mag", "magType",
-        "nst", "gap", "dmin", "rms", "net", "id", "updated", "place", "type",
-        "horizontalError", "depthError", "magError", "magNst", "status",
-        "locationSource", "magSource"
-    ]
-
-    out_df = pd.DataFrame(rows, columns=cols)
-    out_df.attrs["_query_ms"] = int((time.time() - t0) * 1000)
+    for name in unparsed:
+        out_df[name] = pd.to_numeric(out_df[name], errors="coerce")
+    for name, type_name in types.items():
+        if type_name in _TEMPORAL_TYPES and name in out_df:
+            out_df[name] = pd.to_datetime(out_df[name], utc=True, errors="coerce")
     return out_df
 
-@st.cache_data(show_spinner=False)
-def run_food_sql(query: str):
-    """Execute SQL via Databricks SQL Statements REST API and return a DataFrame."""
+@functools.lru_cache(maxsize=None)
+def _config():
+    """Resolve Databricks settings from the environment once per process.
+
+    Returns ``(host_url, warehouse_id, statements_url, headers)``. A missing setting raises
+    on every call (lru_cache does not store exceptions), so the app can still report it.
+    """
     # Read Databricks config from environment (same names used in assignmentTwo.py)
     DATABRICKS_SERVER_HOSTNAME = os.getenv("DATABRICKS_SERVER_HOSTNAME")
     DATABRICKS_HOST_URL = os.getenv("DATABRICKS_HOST_URL") or (f"https://{DATABRICKS_SERVER_HOSTNAME}" if DATABRICKS_SERVER_HOSTNAME else None)
     DATABRICKS_WAREHOUSE_ID = os.getenv("DATABRICKS_WAREHOUSE_ID")
     DATABRICKS_PERSONAL_ACCESS_TOKEN = os.getenv("DATABRICKS_PERSONAL_ACCESS_TOKEN")
 
-    # Quick network precheck to avoid long hangs on unreachable host
-    if DATABRICKS_SERVER_HOSTNAME:
-        try:
-            sock = socket.create_connection((DATABRICKS_SERVER_HOSTNAME, 443), timeout=5)
-            sock.close()
-        except Exception as e:
-            raise RuntimeError(f"Network error reaching {DATABRICKS_SERVER_HOSTNAME}: {e}")
-
     if not (DATABRICKS_HOST_URL and DATABRICKS_WAREHOUSE_ID and DATABRICKS_PERSONAL_ACCESS_TOKEN):
         raise RuntimeError(
             "Missing Databricks REST API configuration. Ensure DATABRICKS_HOST_URL (or DATABRICKS_SERVER_HOSTNAME), "
@@ -131,21 +132,41 @@ def run_food_sql(query: str):
         "Authorization": f"Bearer {DATABRICKS_PERSONAL_ACCESS_TOKEN}",
         "Content-Type": "application/json",
     }
+    return DATABRICKS_HOST_URL, DATABRICKS_WAREHOUSE_ID, url, headers
+
+def _execute_statement(query: str, cols: tuple, parameters: tuple = ()) -> pd.DataFrame:
+    """Execute SQL via Databricks SQL Statements REST API and return a DataFrame.
+
+    ``cols`` names the columns of a JSON result that matches the table schema;
+    ``parameters`` is a tuple of ``(name, value, type)`` bound to ``:name`` markers in ``query``.
+    """
+    DATABRICKS_HOST_URL, DATABRICKS_WAREHOUSE_ID, url, headers = _config()
+
     payload = {
         "warehouse_id": DATABRICKS_WAREHOUSE_ID,
         "statement": query,
-        "wait_timeout": "30s",
+        "wait_timeout": "50s",
+        "on_wait_timeout": "CONTINUE",
+        "format": "ARROW_STREAM",
+        "disposition": "EXTERNAL_LINKS",
     }
+    if parameters:
+        payload["parameters"] = [{"name": n, "value": str(v), "type": t} for n, v, t in parameters]
 
-    t0 = time.time()
-    resp = requests.post(url, headers=headers, json=payload, timeout=60)
+    t0 = time.monotonic()
+    try:
+        # Short connect timeout so an unreachable host fails fast; reads may wait for the server-side long-poll
+        resp = SESSION.post(url, headers=headers, json=payload, timeout=(3, 60))
+    except requests.ConnectionError as e:
+        raise RuntimeError(f"Network error reaching {DATABRICKS_HOST_URL}: {e}")
     if resp.status_code != 200:
         raise RuntimeError(f"Error submitting statement: {resp.status_code} - {resp.text}")
-    body = resp.json()
+    body = _json(resp)
+    manifest = body.get("manifest") or {}
 
-    # If result is immediately available
-    if body.get("status", {}).get("state") in ("SUCCEEDED",) and body.get("result"):
-        result = body["result"]
+    # Finished within the submit's wait window: links or rows are already in the body, no polling
+    if (body.get("status") or {}).get("state") == "SUCCEEDED":
+        result = body.get("result") or {}
     else:
         # Poll for completion
         stmt_id = body.get("statement_id") or body.get("statement", {}).get("statement_id") or body.get("id")
@@ -157,40 +178,142 @@ def run_food_sql(query: str):
                 raise RuntimeError("Did not receive a statement_id or result from Databricks API.")
         else:
             poll_url = f"{url}/{stmt_id}"
-            deadline = time.time() + 120  # up to 2 minutes
-            last_state = None
-            while time.time() < deadline:
-                r = requests.get(poll_url, headers=headers, timeout=30)
+            monotonic, sleep = time.monotonic, time.sleep
+            deadline = monotonic() + 300  # up to 5 minutes after the submit returned
+            delay, next_delay = 0.1, 0.1
+            while monotonic() < deadline:
+                # Ask the server to hold the poll open until the state changes
+                poll_started = monotonic()
+                r = SESSION.get(poll_url, headers=headers, params={"wait_timeout": "50s"}, timeout=(3, 55))
                 if r.status_code != 200:
                     raise RuntimeError(f"Polling error: {r.status_code} - {r.text}")
-                data = r.json()
-                state = data.get("status", {}).get("state")
-                if state != last_state:
-                    last_state = state
-                if state in ("SUCCEEDED",):
-                    result = data.get("result")
+                data = _json(r)
+                state = (data.get("status") or {}).get("state")
+                if state == "SUCCEEDED":
+                    result = data.get("result") or {}
+                    manifest = data.get("manifest") or manifest
                     break
                 if state in ("FAILED", "CANCELED"):
                     raise RuntimeError(f"Statement {state.lower()}: {data}")
-                time.sleep(1.0)
+                # Back off only when the server answered immediately instead of long-polling;
+                # fibonacci steps from 100ms, capped at 5s
+                if monotonic() - poll_started < 1.0:
+                    sleep(delay)
+                    delay, next_delay = next_delay, min(delay + next_delay, 5.0)
             else:
                 raise RuntimeError("Timed out waiting for statement to complete.")
 
-
-    print(result)
-    
-    
-    if not result:
+    # An empty result set may come back without a result body; the manifest still has the schema
+    if not result and not manifest:
         raise RuntimeError("No result returned from Databricks API.")
+    logger.debug("statement result keys=%s rows=%d", list(result.keys()), len(result.get("data_array", [])))
+
+    # Arrow chunks carry their own schema and typed columns
+    if result.get("external_links"):
+        out_df = _read_arrow_links(result, DATABRICKS_HOST_URL, headers)
+        out_df.attrs["_query_ms"] = int((time.monotonic() - t0) * 1000)
+        return out_df
 
     # Parse columns and rows
     rows = result.get("data_array", [])
-    
-    # Manual column names matching schema (22 columns, no duplicates)
-    cols = [
-        "Amount","Food","Category"
-    ]
-
-    out_df = pd.DataFrame(rows, columns=cols)
-    out_df.attrs["_query_ms"] = int((time.time() - t0) * 1000)
+
+    # Aggregate queries return their own projection; take names from the manifest
+    columns_meta = manifest.get("schema", {}).get("columns", [])
+    if columns_meta and len(columns_meta) != len(cols):
+        cols = [c["name"] for c in columns_meta]
+
+    out_df = _rows_to_df(rows, cols, columns_meta)
+    out_df.attrs["_query_ms"] = int((time.monotonic() - t0) * 1000)
+    return out_df
+
+# Quoted literals/identifiers (kept verbatim) or a whitespace run (collapsed)
+_SQL_TOKENS = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|\s+""")
+
+def _normalize_sql(query: str) -> str:
+    """Collapse whitespace outside quoted literals so formatting differences don't produce
+    distinct cache keys."""
+    return _SQL_TOKENS.sub(lambda m: m.group(1) or " ", query.strip())
+
+def _evict_disk_cache():
+    """Delete the oldest cache files until the directory fits in _CACHE_MAX_BYTES."""
+    files = sorted(_CACHE_DIR.glob("*.feather"), key=lambda f: f.stat().st_mtime)
+    total = sum(f.stat().st_size for f in files)
+    for f in files:
+        if total <= _CACHE_MAX_BYTES:
+            break
+        total -= f.stat().st_size
+        f.unlink(missing_ok=True)
+
+def _disk_cached_statement(query: str, cols: tuple, parameters: tuple = ()) -> pd.DataFrame:
+    """``_execute_statement`` behind a Feather file cache keyed on the warehouse, the query and
+    its parameters. Makes no Streamlit calls, so it is safe on background threads."""
+    _, warehouse_id, _, _ = _config()
+    key = hashlib.blake2b(repr((warehouse_id, query, cols, parameters)).encode(), digest_size=16).hexdigest()
+    path = _CACHE_DIR / f"{key}.feather"
+    try:
+        if time.time() - path.stat().st_mtime < _CACHE_TTL:
+            return pd.read_feather(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # Unreadable (e.g. truncated) file: treat as a miss and drop it so the fresh result replaces it
+        logger.warning("Discarding unreadable cache file %s: %s", path, e)
+        path.unlink(missing_ok=True)
+
+    out_df = _execute_statement(query, cols, parameters)
+    tmp = None
+    try:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Unique temp file per writer, so concurrent fills of the same key never share an inode
+        fd, tmp = tempfile.mkstemp(dir=_CACHE_DIR, suffix=".tmp")
+        os.close(fd)
+        out_df.to_feather(tmp, compression="lz4")
+        os.replace(tmp, path)
+        _evict_disk_cache()
+    except Exception as e:
+        # A cache write failure must not fail the query
+        logger.warning("Could not write cache file %s: %s", path, e)
+        if tmp:
+            pathlib.Path(tmp).unlink(missing_ok=True)
     return out_df
+
+# Seconds an in-process result stays fresh; callers holding results of their own should honour it too
+RESULT_TTL = 600
+
+@st.cache_resource(ttl=RESULT_TTL, max_entries=32, show_spinner="Querying Databricks...")
+def _run_sql_impl(query: str, cols: tuple, parameters: tuple = ()) -> pd.DataFrame:
+    """``_disk_cached_statement`` behind the in-process cache. Callers pass ``query`` through
+    ``_normalize_sql``.
+
+    The cached frame is shared by every caller and must not be mutated; use ``run_sql``.
+    """
+    return _disk_cached_statement(query, cols, parameters)
+
+# Manual column names matching schema (22 columns, no duplicates)
+_EARTHQUAKE_COLS = (
+    "time", "latitude", "longitude", "depth", "mag", "magType",
+    "nst", "gap", "dmin", "rms", "net", "id", "updated", "place", "type",
+    "horizontalError", "depthError", "magError", "magNst", "status",
+    "locationSource", "magSource"
+)
+_FOOD_COLS = ("Amount", "Food", "Category")
+
+def run_sql(query: str, parameters: tuple = ()):
+    """Run a query against the earthquakes table; ``parameters`` as in ``_execute_statement``."""
+    # Shallow copy: callers may add or replace columns without touching the shared cached frame
+    return _run_sql_impl(_normalize_sql(query), _EARTHQUAKE_COLS, parameters).copy(deep=False)
+
+def run_food_sql(query: str, parameters: tuple = ()):
+    """Run a query against the sample food table; ``parameters`` as in ``_execute_statement``."""
+    return _run_sql_impl(_normalize_sql(query), _FOOD_COLS, parameters).copy(deep=False)
+
+# Process-wide pool for statements that overlap the script thread; module import runs once
+_BACKGROUND = ThreadPoolExecutor(max_workers=4)
+
+def submit_sql(query: str, parameters: tuple = ()) -> Future:
+    """Start an earthquakes query on a background thread and return a Future of its DataFrame.
+
+    The worker goes through the file cache only and never touches Streamlit, so it needs no
+    script run context and renders no spinner. The resulting frame may be shared; don't mutate it.
+    """
+    return _BACKGROUND.submit(_disk_cached_statement, _normalize_sql(query), _EARTHQUAKE_COLS, tuple(parameters))
@@ -1,47 +1,106 @@
+import datetime
+import functools
+import math
 import pandas as pd
 
-def build_where_from_params(params):
+def build_where_from_params(params, table_min_date=None):
+    """Return (where_clause, sql_params) where sql_params binds the :name markers in the clause.
+
+    ``table_min_date`` is the table's earliest event date; a start date equal to it excludes
+    nothing, so only the upper time bound is emitted. The upper bound is always kept, since
+    rows newer than a cached max date may have arrived since.
+    """
+    return _build_where(tuple(sorted(params.items())), table_min_date)
+
+@functools.lru_cache(maxsize=256)
+def _build_where(param_items, table_min_date):
+    params = dict(param_items)
     conds = []
+    sql_params = []
 
-    # Time filter
+    # Time filter; the lower bound is dropped when it is the table's earliest date
     if params.get('time_min') and params.get('time_max'):
-        s = pd.to_datetime(params['time_min']).strftime('%Y-%m-%d')
-        e = pd.to_datetime(params['time_max']).strftime('%Y-%m-%d')
-        conds.append(f"time >= to_timestamp('{s}') AND time < to_timestamp('{e}') + INTERVAL 1 DAY")
+        if params['time_min'] != table_min_date:
+            conds.append("time >= :time_min")
+            sql_params.append(("time_min", _iso_date(params['time_min']), "DATE"))
+        conds.append("time < :time_max + INTERVAL 1 DAY")
+        sql_params.append(("time_max", _iso_date(params['time_max']), "DATE"))
 
     # Magnitude filter (range)
     mag_min = params.get('mag_min', 0)
     mag_max = params.get('mag_max', 10)
     if mag_min > 0 or mag_max < 10:
-        conds.append(f"mag >= {mag_min} AND mag <= {mag_max}")
+        conds.append("mag >= :mag_min AND mag <= :mag_max")
+        sql_params += [("mag_min", mag_min, "DOUBLE"), ("mag_max", mag_max, "DOUBLE")]
 
     # Location radius filter
     if (params.get('latitude') is not None and params.get('longitude') is not None and params.get('radius_km')):
         lat = params['latitude']
         lon = params['longitude']
         radius = params['radius_km']
-        dist_expr = distance_km_sql(lat=f"{lat:.6f}", lon=f"{lon:.6f}")
-        conds.append(f"{dist_expr} <= {radius}")
+        # Cheap range predicates first so file/row-group stats can skip data before the trig runs
+        lat_lo, lat_hi, lon_lo, lon_hi = bbox_from_radius(lat, lon, radius)
+        conds.append("latitude BETWEEN :lat_lo AND :lat_hi")
+        sql_params += [("lat_lo", lat_lo, "DOUBLE"), ("lat_hi", lat_hi, "DOUBLE")]
+        if lon_lo is not None:
+            conds.append("longitude BETWEEN :lon_lo AND :lon_hi")
+            sql_params += [("lon_lo", lon_lo, "DOUBLE"), ("lon_hi", lon_hi, "DOUBLE")]
+            # Multiply-add disc test in degrees before the trig. Scaling longitude by the box's smallest
+            # cos(lat) and using 111 km/deg keeps it a superset of the haversine radius
+            cos_lat_min = min(math.cos(math.radians(lat_lo)), math.cos(math.radians(lat_hi)))
+            conds.append("pow(latitude - :lat, 2) + pow((longitude - :lon) * :cos_lat_min, 2) <= :radius_deg_sq")
+            sql_params += [("cos_lat_min", cos_lat_min, "DOUBLE"), ("radius_deg_sq", (radius / 111.0) ** 2, "DOUBLE")]
+
+        # cos(lat) of the center is constant for the query, so compute it here rather than per row
+        dist_expr = distance_km_sql(lat=":lat", lon=":lon", cos_lat=":cos_lat")
+        conds.append(f"{dist_expr} <= :radius_km")
+        sql_params += [
+            ("lat", lat, "DOUBLE"), ("lon", lon, "DOUBLE"),
+            ("cos_lat", math.cos(math.radians(lat)), "DOUBLE"), ("radius_km", radius, "DOUBLE"),
+        ]
+
+    return ((" WHERE " + " AND ".join(conds)) if conds else ""), tuple(sql_params)
 
-    return (" WHERE " + " AND ".join(conds)) if conds else ""
+def _iso_date(value) -> str:
+    """Format a date for a DATE parameter; only non-date inputs go through pandas parsing."""
+    if isinstance(value, datetime.date):  # also covers datetime
+        return value.strftime('%Y-%m-%d')
+    return pd.to_datetime(value).strftime('%Y-%m-%d')
 
-def distance_km_sql(lat_col: str = "latitude", lon_col: str = "longitude", lat: float = 0.0, lon: float = 0.0) -> str:
+def bbox_from_radius(lat: float, lon: float, km: float):
+    """Return (lat_lo, lat_hi, lon_lo, lon_hi) enclosing every point within km of (lat, lon).
+
+    The longitude bounds are None when the box would reach a pole or wrap the antimeridian.
+    """
+    dlat = km / 111.0
+    lat_lo, lat_hi = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if lat_lo <= -90.0 or lat_hi >= 90.0:
+        return lat_lo, lat_hi, None, None
+    dlon = km / (111.0 * min(math.cos(math.radians(lat_lo)), math.cos(math.radians(lat_hi))))
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return lat_lo, lat_hi, None, None
+    return lat_lo, lat_hi, lon - dlon, lon + dlon
+
+@functools.lru_cache(maxsize=32)
+def distance_km_sql(lat_col: str = "latitude", lon_col: str = "longitude", lat: float = 0.0, lon: float = 0.0, cos_lat: str = None) -> str:
+    if cos_lat is None:
+        cos_lat = f"cos(radians({lat}))"
     return (
         "2 * asin(sqrt("
         f"pow(sin((radians({lat}) - radians({lat_col})) / 2), 2) + "
-        f"cos(radians({lat_col})) * cos(radians({lat})) * pow(sin((radians({lon}) - radians({lon_col})) / 2), 2)"
+        f"cos(radians({lat_col})) * {cos_lat} * pow(sin((radians({lon}) - radians({lon_col})) / 2), 2)"
         ")) * 6371"
     )
     
     
 def build_food_query(params):
+    """Return (where_clause, sql_params) for the food table, like build_where_from_params."""
     conds = []
-    
-    min, max = params.get("amt_range")
+    sql_params = []
     
     if params.get("amt_range"):
-        conds.append(f"Amount >= {min} AND Amount <= {max}")
+        amt_min, amt_max = params["amt_range"]
+        conds.append("Amount >= :amt_min AND Amount <= :amt_max")
+        sql_params += [("amt_min", amt_min, "DOUBLE"), ("amt_max", amt_max, "DOUBLE")]
         
-    return (" WHERE " + " AND ".join(conds)) if conds else ""
-    
-    
\ No newline at end of file
+    return ((" WHERE " + " AND ".join(conds)) if conds else ""), tuple(sql_params)
@@ -15,28 +15,38 @@ DATABRICKS_PERSONAL_ACCESS_TOKEN = os.getenv("DATABRICKS_PERSONAL_ACCESS_TOKEN")
 DATABRICKS_HOST_URL = os.getenv("DATABRICKS_HOST_URL") or (f"https://{DATABRICKS_SERVER_HOSTNAME}" if DATABRICKS_SERVER_HOSTNAME else None)
 DATABRICKS_WAREHOUSE_ID = os.getenv("DATABRICKS_WAREHOUSE_ID")
 TABLE_NAME = "workspace.default.sample_food"
-limit = 100
-df = None
+# Columns read by the food charts and results table
+PROJECTION = ("Amount", "Food", "Category")
+amount_range = None
 source_label = None
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_amount_range():
+    """Min and max Amount in the table, used to bound the form's price slider."""
+    ranges = run_food_sql(f"SELECT min(Amount) AS lo, max(Amount) AS hi FROM {TABLE_NAME}")
+    return ranges.iloc[0]
+
 # ---- App Config ----
 st.set_page_config(page_title="Sample Food Data Explorer", layout="wide")
 st.title("Food Data Explorer")
 st.caption("Explore and analyze different food.")
 
-# Auto-load data on app start
-try:
-    df = run_food_sql(f"SELECT * FROM {TABLE_NAME} LIMIT {int(limit)}")
-except Exception as e:
-    st.error(f"Failed to query food data. {e}")
-    st.stop()
-
 # ---- Init session state ----
 if 'show_results' not in st.session_state:
     st.session_state.show_results = False
 if 'query_params' not in st.session_state:
     st.session_state.query_params = {}
 
+# Auto-load the Amount bounds for the form's price slider once per session
+if not st.session_state.show_results:
+    try:
+        if 'amount_range' not in st.session_state:
+            st.session_state.amount_range = load_amount_range()
+        amount_range = st.session_state.amount_range
+    except Exception as e:
+        st.error(f"Failed to query food data. {e}")
+        st.stop()
+
 # ---- Init navigation ----
 if st.session_state.show_results:
     if st.button("← Back to Query Form"):
@@ -48,22 +58,24 @@ else:
 
 if not st.session_state.show_results:
     # ---- Render form ----
-    FoodDataForm(df)
+    FoodDataForm(amount_range)
 else:
     # ---- Render Results ----
     params = st.session_state.query_params
     
     # Build query
-    where_clause = build_food_query(params)
-    q = f"SELECT * FROM {TABLE_NAME}{where_clause}"
+    where_clause, sql_params = build_food_query(params)
+    q = f"SELECT {', '.join(PROJECTION)} FROM {TABLE_NAME}{where_clause}"
     
     # Execute query and show results
     try:
-        filtered_df = run_food_sql(q)
+        filtered_df = run_food_sql(q, sql_params)
         
         # Show query details
         with st.expander("Query Details"):
             st.code(q)
+            if sql_params:
+                st.json({name: value for name, value, _ in sql_params})
         
         # # # Visualizations
         st.subheader("Visualizations")